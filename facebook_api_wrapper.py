@@ -9,11 +9,22 @@ all with rate limiting.
 # -*- coding: utf-8 -*-
 
 import datetime
+import hashlib
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import facebook
 import logging
+import orjson
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import wraps
 import pytz
 
@@ -77,6 +88,64 @@ POST_INSIGHT_FIELD = "insights.metric({})".format(  # extra insights field
         "post_reactions_by_type_total",
     ]))  # TEST tested last in 2019, if needed, test!
 
+PROFILE_FIELDS_STR = "id,fan_count,username,link,name"
+# fields strings are joined once, not on every api call
+POST_FIELDS_STR = ",".join(POST_FIELDS)
+POST_FIELDS_WITH_INSIGHTS_STR = "{},{}".format(
+    POST_FIELDS_STR, POST_INSIGHT_FIELD)
+COMMENT_FIELDS_STR = ",".join(COMMENT_FIELDS)
+
+# fields called even if caller restricts fields (needed for transformations
+# and pagination)
+REQUIRED_POST_FIELDS = ["id", "created_time"]
+REQUIRED_COMMENT_FIELDS = ["id"]
+
+TRANSFORMED_POST_FIELDS = [  # fields read by FbApi.transform_posts
+    "comments",
+    "from",
+    "likes",
+    "like_count",
+    "reactions",
+    "shares",
+    ]
+
+CREATED_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"  # ie. 2019-01-31T12:00:00+0000
+
+MAX_PAGE_SIZE = 25  # maximal number of posts in the first profile posts page
+
+MAX_WORKERS = 16  # maximal number of concurrent api calls
+
+GRAPH_API_VERSION = "3.1"
+GRAPH_API_URL = "https://graph.facebook.com/v{}/".format(GRAPH_API_VERSION)
+BATCH_SIZE = 50  # maximal number of requests in one Graph api batch
+REQUEST_TIMEOUT = 30  # seconds
+
+RATE_LIMIT_CODES = [4, 17, 32, 613]  # Graph api throttling error codes
+RATE_LIMIT_MIN_WAIT = 30  # seconds, doubled after every rate limited call
+RATE_LIMIT_MAX_WAIT = 900  # seconds
+
+POST_CACHE_TTL = 3600  # seconds, default age of disk cached posts
+PROFILE_CACHE_TTL = 86400  # seconds, age of disk cached profiles info
+
+
+def rate_limit_wait(tries: int, regain_access_secs: int) -> int:
+    """Return seconds to wait before the next call after rate limit error.
+
+    Wait grows exponentially with number of rate limited `tries`, but it is
+    never shorter than time to regain access announced by Graph api headers
+    and never longer than RATE_LIMIT_MAX_WAIT.
+
+    Parameters
+    ----------
+    tries : int
+        number of previous rate limited calls
+    regain_access_secs : int
+        seconds to regain access reported by Graph api (0 if unknown)
+    """
+    return min(
+        max(RATE_LIMIT_MIN_WAIT * 2 ** tries, regain_access_secs),
+        RATE_LIMIT_MAX_WAIT)
+
 
 class SocialMediaApi:
     """Handles common features of Facebook and Twitter api.
@@ -97,7 +166,8 @@ class SocialMediaApi:
         Parameters
         ----------
         df : pd.DataFrame
-            DataFrame to save
+            DataFrame to save; it should be the single final table (build it
+            once from all rows rather than concatenating partial tables)
         path : str
             path to table output file. Based on extension, table is saved to:
                 None: nowhere
@@ -115,6 +185,126 @@ class SocialMediaApi:
         else:
             df.to_csv(path, encoding="utf-8")
 
+    def map_concurrently(self, func, ids: list):
+        """Yield results of `func` called on every id, in order of `ids`.
+
+        Api calls are I/O bound, thus they are run in up to MAX_WORKERS
+        threads at once. Results are yielded as soon as they are ready, thus
+        they can be processed while next ones are downloaded.
+
+        Parameters
+        ----------
+        func : callable
+            function called with a single id
+        ids : list of strs or ints
+            ids passed to `func`
+        """
+        ids = list(ids)
+        if len(ids) == 0:
+            return
+
+        with ThreadPoolExecutor(
+                max_workers=min(MAX_WORKERS, len(ids))) as executor:
+            yield from executor.map(func, ids)
+
+    def iter_concurrently(self, func, ids: list):
+        """Yield (id, item) for items yielded by `func` called on every id.
+
+        Generators `func(id)` are run in up to MAX_WORKERS threads at once.
+        Items are yielded as soon as they are ready (items of different ids
+        are interleaved) and at most MAX_WORKERS of them wait in memory.
+
+        Parameters
+        ----------
+        func : callable
+            generator function called with a single id
+        ids : list of strs or ints
+            ids passed to `func`
+        """
+        ids = list(ids)
+        if len(ids) == 0:
+            return
+
+        items = queue.Queue(maxsize=MAX_WORKERS)
+        stopped = threading.Event()  # set if items are not consumed anymore
+        done = object()  # marks finished generator
+
+        def put_items(i):
+            try:
+                for item in func(i):
+                    if stopped.is_set():
+                        break
+                    items.put((i, item))
+            finally:
+                items.put((i, done))
+
+        with ThreadPoolExecutor(
+                max_workers=min(MAX_WORKERS, len(ids))) as executor:
+            futures = [executor.submit(put_items, i) for i in ids]
+            n_running = len(futures)
+            try:
+                while n_running > 0:
+                    i, item = items.get()
+                    if item is done:
+                        n_running -= 1
+                    else:
+                        yield i, item
+            finally:
+                # unblock running generators if consumer stopped early
+                stopped.set()
+                n_running -= sum(future.cancel() for future in futures)
+                while n_running > 0:
+                    if items.get()[1] is done:
+                        n_running -= 1
+
+            for future in futures:
+                future.result()  # raises errors of generators
+
+    def save_df_chunks(self, dfs, path: str, columns: list):
+        """Save DataFrames one by one to a single csv table.
+
+        Unlike self.save_df, whole table is never held in memory: each
+        DataFrame is appended to `path` as soon as it is generated.
+
+        Parameters
+        ----------
+        dfs : iterable of pd.DataFrames
+            parts of the table to save
+        path : str
+            path to csv output file
+        columns : list of strs
+            columns of the table (parts are reindexed to them, thus all rows
+            are aligned)
+        """
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            # header is written even if no part is generated
+            pd.DataFrame(columns=columns).to_csv(f)
+            n_rows = 0
+            for df in dfs:
+                df = df.reindex(columns=columns)
+                df.index = range(n_rows, n_rows + len(df))
+                df.to_csv(f, header=False)
+                n_rows += len(df)
+
+    def unique_ids(self, ids: list) -> list:
+        """Return `ids` without duplicates, in order of first occurrence.
+
+        Duplicates would only repeat api calls, thus they are dropped with a
+        warning (output has a single row per id).
+
+        Parameters
+        ----------
+        ids : list of strs or ints
+            ids passed to api calls
+        """
+        ids = list(ids)
+        unique = list(dict.fromkeys(ids))
+        if len(unique) < len(ids):
+            logging.warning(
+                "{} duplicate ids skipped, each id is called only once"
+                .format(len(ids) - len(unique)))
+        return unique
+
     def add_info(self, df: pd.DataFrame):
         """Return `df` with profiles info columns.
 
@@ -134,13 +324,11 @@ class SocialMediaApi:
             info_df = self.profiles_info(ids_downloaded)
             info_df = info_df.add_prefix("profile_")
 
-            info_df.profile_api_call_id = info_df.profile_api_call_id.astype(
-                "str")
+            # profiles are unique, thus they are joined by index instead of
+            # merging columns of both tables
+            info_df.index = info_df.profile_api_call_id.astype("str")
             df[self.post_from_col] = df[self.post_from_col].astype("str")
-            df = df.merge(
-                info_df, how="left",
-                left_on=self.post_from_col,
-                right_on="profile_api_call_id")
+            df = df.join(info_df, on=self.post_from_col, how="left")
 
             return df
 
@@ -156,11 +344,13 @@ class SocialMediaApi:
 
         Output index 'api_call_id' notes profile id/name on which api was called.
         """
+        ids = self.unique_ids(ids)
+
         elements = []
-        for i in ids:
-            element = self.get_profile_info(i)
-            element["api_call_id"] = i
-            elements.append(element)
+        for i, element in zip(ids, self.get_profiles_info(ids)):
+            if element is not None:
+                element["api_call_id"] = i
+                elements.append(element)
 
         df = pd.DataFrame(elements)
         self.save_df(df, path)
@@ -173,7 +363,8 @@ class SocialMediaApi:
             insights: bool=False,
             comments: bool=False,
             info: bool=False,
-            path: str=None) -> pd.DataFrame:
+            path: str=None,
+            fields: list=None) -> pd.DataFrame:
         """Return posts acquired by api calls.
 
         Parameters
@@ -191,19 +382,23 @@ class SocialMediaApi:
             profiles info); usage includes accessing Facebook profile fans
         path : str or None (default None)
             if passed, dataframe is saved there as csv
+        fields : list of strs or None (default None)
+            if passed, only these post fields are called (smaller responses),
+            otherwise all POST_FIELDS are called; 'from' is added if `info`
         """
-        posts = []
-        for i in ids:
-            element = self.get_post(i, insights=insights)
-            if element is not None:
-                posts.extend(self.transform_posts([element], i))
+        ids = self.unique_ids(ids)
+        if info and fields is not None:
+            # profiles info is joined by post author id
+            fields = list(fields) + ["from"]
 
-        return posts
-        try:
-            df = pd.DataFrame(posts)
-        except AttributeError:
-            print(posts)
-            return posts
+        elements = []
+        call_ids = []
+        downloaded = self.get_posts(ids, insights=insights, fields=fields)
+        for i, element in zip(ids, downloaded):
+            if element is not None:
+                elements.append(element)
+                call_ids.append(i)
+        df = self.transform_posts(elements, call_ids)
 
         if info:
             df = self.add_info(df)
@@ -222,7 +417,9 @@ class SocialMediaApi:
             insights: bool=False,
             comments: bool=False,
             info: bool=False,
-            path: str=None
+            path: str=None,
+            stream: bool=False,
+            fields: list=None
             ) -> pd.DataFrame:
         """Return posts from profiles within time range acquired by api calls.
 
@@ -247,73 +444,115 @@ class SocialMediaApi:
             profiles info); usage includes accessing Facebook profile fans
         path : str (default None)
             if passed, dataframe is saved there as csv
+        stream : bool (default False)
+            whether each page of posts should be appended to csv `path` as
+            soon as it is downloaded instead of holding the table in memory
+            (rows of profiles are interleaved, empty DataFrame is returned);
+            not available for Excel `path`, `info` and `comments`
+        fields : list of strs or None (default None)
+            if passed, only these post fields are called (smaller responses),
+            otherwise all POST_FIELDS are called; 'from' is added if `info`
         """
+        ids = self.unique_ids(ids)
+        if info and fields is not None:
+            # profiles info is joined by post author id
+            fields = list(fields) + ["from"]
+
         def add_timezone(x):
             if x.tzinfo is None:
                 return pytz.utc.localize(x)
             else:
                 return x
 
-        def paginate_elements(first_connection):
-            connection = first_connection
+        # timezone is needed for dates comparison
+        since_tz = add_timezone(since)
+        until_tz = add_timezone(until)
+
+        def in_time_range(elements):
+            # erase posts outside of time range (Twitter does not allow to
+            # download specific time range, but posts have to be downloaded
+            # from present backwards); Facebook dates are all in UTC, thus
+            # they are compared as strings
+            since_str = since_tz.astimezone(pytz.utc).strftime(
+                CREATED_TIME_FORMAT)
+            until_str = until_tz.astimezone(pytz.utc).strftime(
+                CREATED_TIME_FORMAT)
+            return [
+                element for element in elements
+                if since_str <= self.connection_date(element) <= until_str]
+
+        def profile_pages(i):
+            # yields posts of each page within time range; next page is
+            # requested only if time range and number of posts are not
+            # exceeded yet, and it is downloaded while current page is
+            # trimmed and processed by the caller
 
-            while (
-                    (len(elements) < n) and
-                    (pd.to_datetime(
-                        self.connection_date(elements[-1])) > since_tz)):
-                try:
-                    connection = self.get_next_connection(connection)
-                except KeyError:
+            # First, self.get_profile_posts_initial_page is called.
+            connection = self.get_profile_posts_initial_call(
+                i, since_tz, until_tz, n, insights, fields=fields)
+            if not self.returns_data(connection):
+                return
+
+            # Afterwards, next page of results is listed until number of
+            # posts or time range is exceeded.
+            n_downloaded = 0
+            while True:
+                page = self.connection_data(connection)
+                n_downloaded += len(page)
+
+                next_connection = None
+                if (n_downloaded < n and pd.to_datetime(
+                        self.connection_date(page[-1])) > since_tz):
+                    next_connection = self.prefetch_next_connection(
+                        connection)
+
+                yield in_time_range(page)
+
+                if next_connection is None:
+                    return
+                connection = next_connection.result()
+                if connection is None:
                     logging.info(
                         ("connection has no next page: downloading profile "
                          "posts with parameters {}")
                         .format([i, since, until, n, insights]))
-                    return elements
-
-                if self.returns_data(connection):
-                    elements.extend(self.connection_data(connection))
-                else:
+                    return
+                if not self.returns_data(connection):
                     logging.error(
                         ("no data in connection {} while downloading profile "
                          "posts with parameters {}")
                         .format(connection, [i, since, until, n, insights]))
-                    return elements
+                    return
 
-            return elements
-
-        # timezone is needed for dates comparison
-        since_tz = add_timezone(since)
-        until_tz = add_timezone(until)
+        def profile_posts(i):
+            return [post for page in profile_pages(i) for post in page]
 
+        if stream and (
+                path is None or path.endswith(".xlsx") or info or comments):
+            logging.warning(
+                ("posts are not streamed (only csv path without info and "
+                 "comments can be), whole table is held in memory"))
+            stream = False
+
+        # profiles are independent, thus they are paginated concurrently
+        if stream:
+            # only pages waiting to be written are held in memory
+            self.save_df_chunks(
+                (self.transform_posts(page, i)
+                 for i, page in self.iter_concurrently(profile_pages, ids)),
+                path,
+                self.posts_columns(insights, fields=fields))
+            return pd.DataFrame()
+
+        profiles_elements = self.map_concurrently(profile_posts, ids)
+
+        # rows of all profiles are transformed into a single DataFrame
         posts = []
-        for i in ids:
-            elements = []
-
-            # First, self.get_profile_posts_initial_page is called.
-            connection = self.get_profile_posts_initial_call(
-                i, since_tz, until_tz, n, insights)
-            if self.returns_data(connection):
-                elements.extend(self.connection_data(connection))
-
-                # Afterwards, next page of results is listed until number of
-                # posts or time range is exceeded.
-                elements = paginate_elements(connection)
-                posts.extend(self.transform_posts(elements, i))
-
-        df = pd.DataFrame(posts)
-
-        # erase posts outside of time range (Twitter does not allow to
-        # download specific time range, but posts have to be downloaded from
-        # present backwards)
-        if len(df) > 0:
-            try:
-                df = df.loc[
-                    ((df.created_time >= since) & (df.created_time <= until))]
-            except AttributeError:
-                logging.warning(
-                    ("time range control not executed: downloaded table has "
-                     "no 'created_time' column; present columns: {}")
-                    .format(df.columns))
+        call_ids = []
+        for i, elements in zip(ids, profiles_elements):
+            posts.extend(elements)
+            call_ids.extend([i] * len(elements))
+        df = self.transform_posts(posts, call_ids)
 
         if info:
             df = self.add_info(df)
@@ -324,6 +563,90 @@ class SocialMediaApi:
         return df
 
 
+class DiskCache:
+    """Store downloaded api objects in sqlite database in `cache_dir`.
+
+    Objects are stored as json with time of download, thus repeated runs can
+    skip downloading objects which are not too old.
+
+    Methods
+    -------
+    get(key, ttl) -> dict or None
+        Returns cached object not older than `ttl` seconds.
+    set(key, data)
+        Stores object under `key`.
+    set_many(objects)
+        Stores objects under their keys in a single transaction.
+    close()
+        Closes the database connection.
+    """
+
+    def __init__(self, cache_dir: str):
+        cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # connection is shared by api calls threads
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(cache_dir, "cache.sqlite"),
+            check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                ("CREATE TABLE IF NOT EXISTS objects "
+                 "(key TEXT PRIMARY KEY, time REAL, data BLOB)"))
+
+    def get(self, key: str, ttl: int):
+        """Return cached object or None if it is missing or too old.
+
+        Parameters
+        ----------
+        key : str
+            object key
+        ttl : int
+            maximal age of object in seconds
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT time, data FROM objects WHERE key = ?",
+                (key,)).fetchone()
+
+        if row is None or time.time() - row[0] > ttl:
+            return None
+        return orjson.loads(row[1])
+
+    def set(self, key: str, data):
+        """Store object under `key` with current time.
+
+        Parameters
+        ----------
+        key : str
+            object key
+        data : dict
+            object to store (json serializable)
+        """
+        self.set_many({key: data})
+
+    def set_many(self, objects: dict):
+        """Store objects with current time in a single transaction.
+
+        Parameters
+        ----------
+        objects : dict
+            objects to store (json serializable) by their keys
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+                [(key, now, orjson.dumps(data))
+                 for key, data in objects.items()])
+
+    def close(self):
+        """Close the database connection (cache cannot be used anymore)."""
+        with self.lock:
+            self.connection.close()
+
+
 class FbApi(SocialMediaApi):
     """Handle downloading from Facebook Graph api.
 
@@ -331,6 +654,24 @@ class FbApi(SocialMediaApi):
     ----------
     token: Facebook access token
         (app access token or page access token, based on usage)
+    cache: DiskCache or None
+        disk cache of downloaded posts and profiles info (None if disabled)
+    cache_ttl: int
+        maximal age of disk cached posts in seconds
+    cache_prefix: str
+        prefix of disk cache keys (api version and token hash)
+    session: requests.Session
+        connection pool shared by all api calls
+    regain_access_at: float
+        time.monotonic() when access is regained after rate limit, the
+        latest deadline reported by any response headers
+    paused_until: float
+        time.monotonic() until which api calls of all threads wait after
+        rate limit error
+    prefetch_executor: ThreadPoolExecutor
+        threads downloading next pages of paginated connections
+    profiles_cache: dict
+        already downloaded profiles info, keyed by profile id and username
 
     Methods
     -------
@@ -342,6 +683,8 @@ class FbApi(SocialMediaApi):
         Returns posts from profiles within time range acquired by api calls.
     posts_comments(ids, n=100000, path=False) -> pd.DataFrame
         Returns comments under posts with given ids acquired by api calls.
+    close()
+        Releases background threads, connections and disk cache.
 
     Examples
     --------
@@ -350,6 +693,12 @@ class FbApi(SocialMediaApi):
     >>> f.posts(posts_ids)
     >>> f.profiles_posts(profiles_ids, since, until)
     >>> f.posts_comments(posts_ids)
+    >>> f.close()
+
+    Resources are released also when used as context manager:
+
+    >>> with FbApi("fb_access_token") as f:
+    ...     f.posts(posts_ids)
 
     Notes
     -----
@@ -357,14 +706,70 @@ class FbApi(SocialMediaApi):
         https://github.com/mobolic/facebook-sdk
     """
 
-    def __init__(self, token="xxx"):
-        self.api = facebook.GraphAPI(token, version="3.1")
+    post_from_col = "from_id"  # column of posts table with profile id
+
+    def __init__(self, token="xxx", cache_dir=None, cache_ttl=POST_CACHE_TTL):
+        self.token = token
+
+        # posts and profiles info are stored on disk, thus repeated runs do
+        # not download them again; disabled if cache_dir is None
+        self.cache = DiskCache(cache_dir) if cache_dir is not None else None
+        self.cache_ttl = cache_ttl
+        # objects are cached per api version and token (different tokens
+        # may access different fields, ie. insights), cache_dir can be shared
+        self.cache_prefix = "v{}/{}/".format(
+            GRAPH_API_VERSION,
+            hashlib.sha256(str(token).encode()).hexdigest()[:16])
+
+        # all calls share one connection pool, thus TCP and TLS handshakes
+        # to graph.facebook.com are not repeated for every call
+        # transient server errors are retried by urllib3, Graph api rate
+        # limits are handled by self.rate_limit_* decorators
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=MAX_WORKERS,
+            pool_maxsize=MAX_WORKERS,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=2,
+                status_forcelist=[429, 500, 502, 503, 504],
+                raise_on_status=False)))
+
+        # calls run in many threads, thus rate limit pauses all of them
+        self.rate_limit_lock = threading.Lock()
+        self.paused_until = 0  # time.monotonic() when calls are allowed
+        self.regain_access_at = 0  # only raised by self.record_usage
+        self.session.hooks["response"].append(self.record_usage)
+
+        self.api = facebook.GraphAPI(
+            token,
+            timeout=REQUEST_TIMEOUT,
+            version=GRAPH_API_VERSION,
+            session=self.session)
+
+        # next pages of paginated connections are downloaded in background
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.profiles_cache = {}  # profile info by str id and username
+
+    def close(self):
+        """Release background threads, connections and disk cache."""
+        self.prefetch_executor.shutdown(wait=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def rate_limit_sdk(func):  # TODO max_tries and wait as parameters
         """Return `func` multiple times in case of SDK limit error.
 
-        After each rate limited call, waits for 15 minutes and tries again
-        or gives up after 2 hour limit is reached.
+        After each rate limited call, pauses calls of all threads (see
+        rate_limit_wait) and tries again or gives up after 2 hour limit is
+        reached.
 
         Twin method for self.rate_limit_requests (only difference in error
         code location).
@@ -372,19 +777,23 @@ class FbApi(SocialMediaApi):
         @wraps(func)
         def wrapper(*args, **kwargs):
             max_wait = 7200
-            wait = 900
 
-            max_tries = max_wait // wait
+            waited = 0
             tries = 0
 
-            while tries <= max_tries:
+            while waited <= max_wait:
+                args[0].wait_for_paused_calls()
                 try:
                     return func(*args, **kwargs)
                 except facebook.GraphAPIError as e:
-                    if e.code == 4:
+                    if e.code in RATE_LIMIT_CODES:
+                        wait = rate_limit_wait(
+                            tries, args[0].regain_access_secs())
                         logging.warning(
-                            "request limit reached, waiting for 15 minutes")
-                        time.sleep(wait)
+                            "request limit reached, waiting for {} seconds"
+                            .format(wait))
+                        args[0].pause_calls(wait)
+                        waited += wait
                     else:
                         logging.warning(
                             ("Facebook sdk returned error message while"
@@ -400,7 +809,7 @@ class FbApi(SocialMediaApi):
             logging.error(
                 ("request limit not solved, downloading stopped "
                  "while calling {} with args: {}, kwargs: {}")
-                .format(func.__name__, *args, **kwargs))
+                .format(func.__name__, args, kwargs))
             return []
 
         return wrapper
@@ -408,8 +817,9 @@ class FbApi(SocialMediaApi):
     def rate_limit_requests(func):  # TODO max_tries and wait as parameters
         """Return `func` multiple times in case of request limit error.
 
-        After each rate limited call, waits for 15 minutes and tries again
-        or gives up after 2 hour limit is reached.
+        After each rate limited call, pauses calls of all threads (see
+        rate_limit_wait) and tries again or gives up after 2 hour limit is
+        reached.
 
         Twin method for self.rate_limit_sdk (only difference in error
         code location).
@@ -417,18 +827,22 @@ class FbApi(SocialMediaApi):
         @wraps(func)
         def wrapper(*args, **kwargs):
             max_wait = 7200
-            wait = 900
 
-            max_tries = max_wait // wait
+            waited = 0
             tries = 0
 
-            while tries <= max_tries:
+            while waited <= max_wait:
+                args[0].wait_for_paused_calls()
                 connection = func(*args, **kwargs)
                 if "error" in connection:
-                    if connection["error"]["code"] == 4:
+                    if connection["error"]["code"] in RATE_LIMIT_CODES:
+                        wait = rate_limit_wait(
+                            tries, args[0].regain_access_secs())
                         logging.warning(
-                            "request limit reached, waiting for 15 minutes")
-                        time.sleep(wait)
+                            "request limit reached, waiting for {} seconds"
+                            .format(wait))
+                        args[0].pause_calls(wait)
+                        waited += wait
                     else:
                         logging.warning(
                             ("Facebook sdk returned error message while"
@@ -447,16 +861,78 @@ class FbApi(SocialMediaApi):
             logging.error(
                 ("request limit not solved, downloading stopped "
                  "while calling {} with args: {}, kwargs: {}")
-                .format(func.__name__, *args, **kwargs))
+                .format(func.__name__, args, kwargs))
             return []
 
         return wrapper
 
-    def returns_data(self, connection) -> bool:
+    def pause_calls(self, wait: int):
+        """Pause api calls of all threads for `wait` seconds.
+
+        Parameters
+        ----------
+        wait : int
+            seconds to wait from now
+        """
+        with self.rate_limit_lock:
+            self.paused_until = max(
+                self.paused_until, time.monotonic() + wait)
+
+    def wait_for_paused_calls(self):
+        """Sleep until api calls are not paused by self.pause_calls."""
+        with self.rate_limit_lock:
+            wait = self.paused_until - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def regain_access_secs(self) -> int:
+        """Return seconds until access is regained (0 if not rate limited)."""
+        with self.rate_limit_lock:
+            return max(0, math.ceil(self.regain_access_at - time.monotonic()))
+
+    def record_usage(self, response, *args, **kwargs):
+        """Save time to regain access announced by Graph api usage headers.
+
+        Used as self.session response hook. Business use case and ad account
+        usage headers announce when throttled calls are allowed again, app
+        usage header only reports usage percentage. Responses come from many
+        threads, thus the deadline is only ever extended, responses without
+        rate limit do not reset it.
+
+        Parameters
+        ----------
+        response : requests.Response
+            any response of Graph api
+        """
+        regain_access_secs = 0
         try:
-            return connection["data"] != []
-        except (KeyError, TypeError):
-            return False
+            business_usage = orjson.loads(
+                response.headers.get("X-Business-Use-Case-Usage", "{}"))
+            for usages in business_usage.values():
+                for usage in usages:
+                    regain_access_secs = max(
+                        regain_access_secs,
+                        60 * usage.get("estimated_time_to_regain_access", 0))
+
+            account_usage = orjson.loads(
+                response.headers.get("X-Ad-Account-Usage", "{}"))
+            regain_access_secs = max(
+                regain_access_secs,
+                account_usage.get("reset_time_duration", 0))
+        except (ValueError, AttributeError, TypeError):
+            logging.info(
+                "Graph api usage headers not parsed: {}"
+                .format(response.headers))
+
+        if regain_access_secs > 0:
+            with self.rate_limit_lock:
+                self.regain_access_at = max(
+                    self.regain_access_at,
+                    time.monotonic() + regain_access_secs)
+
+    def returns_data(self, connection) -> bool:
+        # failed calls return [] instead of dict
+        return isinstance(connection, dict) and bool(connection.get("data"))
 
     def connection_data(self, connection):
         return connection["data"]
@@ -464,16 +940,17 @@ class FbApi(SocialMediaApi):
     def connection_date(self, connection):
         return connection["created_time"]
 
-    def transform_posts(self, posts: list, i) -> list:
-        """Return list of posts in dictionaries with additional collumns.
+    def transform_posts(self, posts: list, i) -> pd.DataFrame:
+        """Return DataFrame of posts with additional collumns.
 
         Parameters
         ----------
         posts : list of dicts
             posts to transform
-        i : str or int
+        i : str or int or list
             api call id noting how the row was acquired (ie. from profile with
-            given `i` or by calling post id `i` directly)
+            given `i` or by calling post id `i` directly); list of ids must be
+            aligned with `posts`
 
         New columns:
             comments_count
@@ -489,62 +966,107 @@ class FbApi(SocialMediaApi):
         Updated columns:
             created_time is pd.to_datetime'd
         """
-        def post_with_additional_collumns(post):
-            if post == []:
-                return []
+        df = pd.DataFrame(posts)
+        if len(df) == 0:
+            return df
+
+        # only fields needed for new columns are flattened to columns named
+        # like 'from.id'
+        flat = pd.json_normalize([
+            {field: post[field] for field in TRANSFORMED_POST_FIELDS
+             if field in post}
+            for post in posts])
+
+        def flat_col(col):
+            if col in flat:
+                return flat[col]
             else:
-                try:
-                    post["comments_count"] = post["comments"][
-                        "summary"]["total_count"]
-                except KeyError:
-                    post["comments_count"] = None
-                try:
-                    post["from_id"] = post["from"]["id"]
-                except KeyError:
-                    post["from_id"] = None
-                try:
-                    post["from_name"] = post["from"]["name"]
-                except KeyError:
-                    post["from_name"] = None
+                return pd.Series(None, index=flat.index, dtype="float64")
 
-                post["created_time"] = pd.to_datetime(post["created_time"])
-                post["created_time"] = post["created_time"].replace(
-                    tzinfo=None)
+        df["comments_count"] = flat_col("comments.summary.total_count")
+        df["from_id"] = flat_col("from.id")
+        df["from_name"] = flat_col("from.name")
 
-                try:
-                    post["likes_count"] = post["likes"]["summary"][
-                        "total_count"]
-                except KeyError:
-                    try:
-                        post["likes_count"] = post["like_count"]
-                    except KeyError:
-                        post["likes_count"] = None
-                try:
-                    post["reactions_count"] = post["reactions"]["summary"][
-                        "total_count"]
-                except KeyError:
-                    post["reactions_count"] = None
-                try:
-                    post["shares_count"] = post.get("shares", {}).get(
-                        "count", 0)
-                except KeyError:
-                    pass
-                post["post_link"] = "https://facebook.com/{post_id}".format(
-                    post_id=post["id"])
-
-                interactions_cols = [
-                    "comments_count",
-                    "reactions_count",
-                    "shares_count"
-                    ]
-                post["interactions"] = sum(
-                    [post[col] for col in interactions_cols
-                     if post[col] is not None])
-
-                post["api_call_id"] = i
-
-            return post
-        return [post_with_additional_collumns(post) for post in posts]
+        df["created_time"] = pd.to_datetime(
+            df["created_time"],
+            utc=True,
+            format=CREATED_TIME_FORMAT).dt.tz_localize(None)
+
+        df["likes_count"] = flat_col("likes.summary.total_count").fillna(
+            flat_col("like_count"))
+        df["reactions_count"] = flat_col("reactions.summary.total_count")
+        df["shares_count"] = flat_col("shares.count").fillna(0).astype(int)
+        df["post_link"] = "https://facebook.com/" + df["id"].astype(str)
+
+        interactions_cols = [
+            "comments_count",
+            "reactions_count",
+            "shares_count"
+            ]
+        df["interactions"] = df[interactions_cols].sum(axis=1).astype(int)
+
+        df["api_call_id"] = i
+
+        return df
+
+    def post_fields(self, insights: bool, fields: list=None) -> list:
+        """Return list of called post fields.
+
+        Parameters
+        ----------
+        insights : bool
+            whether insight fields are called
+        fields : list of strs or None (default None)
+            fields requested by caller (REQUIRED_POST_FIELDS are always
+            added); all POST_FIELDS if None
+        """
+        if fields is None:
+            fields = POST_FIELDS
+        else:
+            fields = list(dict.fromkeys(REQUIRED_POST_FIELDS + list(fields)))
+        if insights:
+            fields = fields + [POST_INSIGHT_FIELD]
+        return fields
+
+    def post_fields_str(self, insights: bool, fields: list=None) -> str:
+        """Return comma separated called post fields (see self.post_fields).
+
+        Parameters
+        ----------
+        insights : bool
+            whether insight fields are called
+        fields : list of strs or None (default None)
+            fields requested by caller; all POST_FIELDS if None
+        """
+        if fields is None and insights:
+            return POST_FIELDS_WITH_INSIGHTS_STR
+        elif fields is None:
+            return POST_FIELDS_STR
+        else:
+            return ",".join(self.post_fields(insights, fields))
+
+    def posts_columns(self, insights: bool, fields: list=None) -> list:
+        """Return columns of posts table made by self.transform_posts.
+
+        Parameters
+        ----------
+        insights : bool
+            whether insight fields are called
+        fields : list of strs or None (default None)
+            fields requested by caller; all POST_FIELDS if None
+        """
+        fields = self.post_fields(insights, fields)
+        return [field.split(".")[0] for field in fields] + [
+            "comments_count",
+            "from_id",
+            "from_name",
+            "likes_count",
+            "reactions_count",
+            "shares_count",
+            "post_link",
+            "interactions",
+            "api_call_id",
+            ]
 
     def transform_comments(self, comments, i):
         """Return list of comments in dictionaries with additional collumns.
@@ -567,8 +1089,28 @@ class FbApi(SocialMediaApi):
         comments = [comment_with_additional_collumns(c) for c in comments]
         return comments
 
-    @rate_limit_sdk
     def get_profile_info(self, i) -> dict:
+        """Return profile info, downloaded only if not cached yet.
+
+        Parameters
+        ----------
+        i : str or int
+            profile id or name
+        """
+        if str(i) not in self.profiles_cache:
+            key = "{}?fields={}".format(i, PROFILE_FIELDS_STR)
+            info = self.load_cached(key, PROFILE_CACHE_TTL)
+            if info is None:
+                info = self.download_profile_info(i)
+                if info == []:  # api call failed
+                    return info
+                self.save_cached({key: info})
+            self.cache_profile_info(i, info)
+
+        return dict(self.profiles_cache[str(i)])
+
+    @rate_limit_sdk
+    def download_profile_info(self, i) -> dict:
         """Return profile info api call.
 
         Parameters
@@ -578,10 +1120,48 @@ class FbApi(SocialMediaApi):
         """
         return self.api.get_connections(
             i,
-            "?fields=id,fan_count,username,link,name")
+            "?fields={}".format(PROFILE_FIELDS_STR))
+
+    def cache_profile_info(self, i, info: dict):
+        """Save profile info to self.profiles_cache.
+
+        Info is saved under called `i` as well as under profile id and
+        username, so that later calls by any of them are not repeated.
+
+        Parameters
+        ----------
+        i : str or int
+            profile id or name on which api was called
+        info : dict
+            downloaded profile info
+        """
+        for key in [i, info.get("id"), info.get("username")]:
+            if key is not None:
+                self.profiles_cache[str(key)] = info
+
+    def get_post(self, i, insights: bool, fields: list=None) -> dict:
+        """Return post, downloaded only if not found in disk cache.
+
+        Parameters
+        ----------
+        i : str or int
+            post id
+        insights : bool
+            whether insight fields should be called (requires page access token
+            with admin rights)
+        fields : list of strs or None (default None)
+            called post fields; all POST_FIELDS if None
+        """
+        key = "{}?fields={}".format(i, self.post_fields_str(insights, fields))
+        post = self.load_cached(key, self.cache_ttl)
+        if post is None:
+            post = self.download_post(i, insights, fields=fields)
+            if post != []:  # api call did not fail
+                self.save_cached({key: post})
+        return post
 
     @rate_limit_sdk
-    def get_post(self, i, insights: bool) -> dict:
+    def download_post(self, i, insights: bool, fields: list=None) -> dict:
         """Return post api call.
 
         Parameters
@@ -591,11 +1171,11 @@ class FbApi(SocialMediaApi):
         insights : bool
             whether insight fields should be called (requires page access token
             with admin rights)
+        fields : list of strs or None (default None)
+            called post fields; all POST_FIELDS if None
         """
-        fields = ",".join(POST_FIELDS)
-        if insights:
-            fields += ",{}".format(POST_INSIGHT_FIELD)
-        return self.api.get_object(i, fields=fields)
+        return self.api.get_object(
+            i, fields=self.post_fields_str(insights, fields))
 
     @rate_limit_sdk
     def get_profile_posts_initial_call(
@@ -604,7 +1184,8 @@ class FbApi(SocialMediaApi):
             since: datetime.datetime,
             until: datetime.datetime,
             n: int,
-            insights: bool) -> dict:
+            insights: bool,
+            fields: list=None) -> dict:
         """Call api for the first profile posts call.
 
         Additional calls are done by self.get_next_connection.
@@ -622,14 +1203,12 @@ class FbApi(SocialMediaApi):
         insights : bool
             whether insight fields should be called (requires page access token
             with admin rights)
+        fields : list of strs or None (default None)
+            called post fields; all POST_FIELDS if None
         """
-        max_n_first = 25
-
-        fields = ",".join(POST_FIELDS)
-        if insights:
-            fields += ",{}".format(POST_INSIGHT_FIELD)
+        fields = self.post_fields_str(insights, fields)
 
-        n_first = min(n, max_n_first)
+        n_first = min(n, MAX_PAGE_SIZE)
         since_secs = int(time.mktime(since.timetuple()))
         until_secs = int(time.mktime(until.timetuple()))
         fields += f"&limit={n_first}&since={since_secs}&until={until_secs}"
@@ -642,7 +1221,8 @@ class FbApi(SocialMediaApi):
     def get_post_comments_initial_call(
             self,
             i: str,
-            n: int
+            n: int,
+            fields: list=None
             ) -> dict:
         """Call api for the first post comments call.
 
@@ -654,8 +1234,15 @@ class FbApi(SocialMediaApi):
             post id
         n : int
             maximal number of downloaded posts
+        fields : list of strs or None (default None)
+            called comment fields (REQUIRED_COMMENT_FIELDS are always added);
+            all COMMENT_FIELDS if None
         """
-        fields = ",".join(COMMENT_FIELDS)
+        if fields is None:
+            fields = COMMENT_FIELDS_STR
+        else:
+            fields = ",".join(
+                dict.fromkeys(REQUIRED_COMMENT_FIELDS + list(fields)))
 
         return self.api.get_connections(
             i,
@@ -670,7 +1257,237 @@ class FbApi(SocialMediaApi):
         connection: dict
             previously downloaded page by requests api call
         """
-        return requests.get(connection["paging"]["next"]).json()
+        response = self.session.get(
+            connection["paging"]["next"], timeout=REQUEST_TIMEOUT)
+        return orjson.loads(response.content)
+
+    def prefetch_next_connection(self, connection: dict) -> Future:
+        """Return future of next page of connection.
+
+        The page is downloaded in background by self.prefetch_executor;
+        future result is None if `connection` has no next page.
+
+        Parameters
+        ----------
+        connection: dict
+            previously downloaded page
+        """
+        def next_connection():
+            if connection.get("paging", {}).get("next") is None:
+                return None
+            return self.get_next_connection(connection)
+
+        return self.prefetch_executor.submit(next_connection)
+
+    @rate_limit_requests
+    def get_batch(self, relative_urls: list) -> list:
+        """Return responses of Graph api batch request.
+
+        Up to BATCH_SIZE GET requests are sent in a single HTTP request.
+
+        Parameters
+        ----------
+        relative_urls : list of strs
+            urls relative to Graph api root, ie. '<id>?fields=<fields>'
+        """
+        batch = [{"method": "GET", "relative_url": url}
+                 for url in relative_urls]
+        response = self.session.post(
+            GRAPH_API_URL,
+            data={"access_token": self.token, "batch": json.dumps(batch)},
+            timeout=REQUEST_TIMEOUT)
+        return orjson.loads(response.content)
+
+    def load_cached(self, key: str, ttl: int):
+        """Return object from self.cache or None if not cached (or too old).
+
+        Parameters
+        ----------
+        key : str
+            url relative to Graph api root, ie. '<id>?fields=<fields>'
+        ttl : int
+            maximal age of cached object in seconds
+        """
+        if self.cache is None:
+            return None
+        return self.cache.get(self.cache_prefix + key, ttl)
+
+    def save_cached(self, objects: dict):
+        """Store downloaded objects to self.cache (if enabled).
+
+        Parameters
+        ----------
+        objects : dict
+            downloaded objects by urls relative to Graph api root, ie.
+            '<id>?fields=<fields>'
+        """
+        if self.cache is not None and len(objects) > 0:
+            self.cache.set_many({
+                self.cache_prefix + key: data
+                for key, data in objects.items()})
+
+    def get_objects(self, ids: list, fields: str, ttl: int=None) -> list:
+        """Return objects with given ids, in order of `ids`.
+
+        Objects missing in disk cache are downloaded by
+        self.download_objects; objects which could not be downloaded are None.
+
+        Parameters
+        ----------
+        ids : list of strs or ints
+            objects ids
+        fields : str
+            comma separated fields called for every object
+        ttl : int or None (default None)
+            maximal age of disk cached objects in seconds; self.cache_ttl if
+            None
+        """
+        def relative_url(i):
+            return "{}?fields={}".format(i, fields)
+
+        if ttl is None:
+            ttl = self.cache_ttl
+
+        ids = list(ids)
+        objects = [self.load_cached(relative_url(i), ttl) for i in ids]
+        missing = [k for k, element in enumerate(objects) if element is None]
+        downloaded = self.download_objects([ids[k] for k in missing], fields)
+
+        for k, element in zip(missing, downloaded):
+            objects[k] = element
+        self.save_cached({
+            relative_url(ids[k]): element
+            for k, element in zip(missing, downloaded)
+            if element is not None})
+        return objects
+
+    def download_objects(self, ids: list, fields: str) -> list:
+        """Return objects with given ids downloaded by batch requests.
+
+        Ids are requested in batches of BATCH_SIZE. Rate limited requests
+        of a batch and requests which did not complete (null batch
+        response) are repeated after a pause of all calls (see
+        rate_limit_wait) until 2 hour limit is reached; objects which could
+        not be downloaded are None.
+
+        Parameters
+        ----------
+        ids : list of strs or ints
+            objects ids
+        fields : str
+            comma separated fields called for every object
+        """
+        rate_limited = object()  # marks requests to repeat
+
+        def download_batch(batch_ids):
+            responses = self.get_batch(
+                ["{}?fields={}".format(i, fields) for i in batch_ids])
+            if len(responses) != len(batch_ids):  # whole batch failed
+                return [None] * len(batch_ids)
+
+            objects = []
+            for i, response in zip(batch_ids, responses):
+                if response is None:  # request did not complete in time
+                    objects.append(rate_limited)
+                    continue
+                if response["code"] == 200:
+                    objects.append(orjson.loads(response["body"]))
+                    continue
+
+                try:
+                    error = orjson.loads(response["body"])["error"]
+                except (TypeError, KeyError, ValueError):
+                    error = {}
+                if error.get("code") in RATE_LIMIT_CODES:
+                    objects.append(rate_limited)
+                else:
+                    logging.warning(
+                        "Facebook batch request for id {} failed: {}"
+                        .format(i, response))
+                    objects.append(None)
+            return objects
+
+        max_wait = 7200
+
+        waited = 0
+        tries = 0
+
+        objects = [None] * len(ids)
+        pending = list(range(len(ids)))  # positions of objects to download
+        while True:
+            batches = [pending[k:k + BATCH_SIZE]
+                       for k in range(0, len(pending), BATCH_SIZE)]
+            results = self.map_concurrently(
+                lambda batch: download_batch([ids[k] for k in batch]),
+                batches)
+
+            limited = []
+            for batch, batch_objects in zip(batches, results):
+                for k, element in zip(batch, batch_objects):
+                    if element is rate_limited:
+                        limited.append(k)
+                    else:
+                        objects[k] = element
+
+            if len(limited) == 0:
+                return objects
+            if waited > max_wait:
+                logging.error(
+                    ("request limit not solved, downloading stopped "
+                     "while calling batch requests for ids: {}")
+                    .format([ids[k] for k in limited]))
+                return objects
+
+            wait = rate_limit_wait(tries, self.regain_access_secs())
+            logging.warning(
+                ("request limit reached for {} batch requests, waiting for {} "
+                 "seconds").format(len(limited), wait))
+            self.pause_calls(wait)
+            waited += wait
+            tries += 1
+            pending = limited
+
+    def get_profiles_info(self, ids: list) -> list:
+        """Return profiles info, in order of `ids` (None if not downloaded).
+
+        Only profiles missing in self.profiles_cache are downloaded.
+
+        Parameters
+        ----------
+        ids : list of strs or ints
+            profiles ids or names
+        """
+        ids = list(ids)
+        missing_ids = list(dict.fromkeys(
+            i for i in ids if str(i) not in self.profiles_cache))
+        missing_infos = self.get_objects(
+            missing_ids, PROFILE_FIELDS_STR, ttl=PROFILE_CACHE_TTL)
+        for i, info in zip(missing_ids, missing_infos):
+            if info is not None:
+                self.cache_profile_info(i, info)
+
+        return [dict(self.profiles_cache[str(i)])
+                if str(i) in self.profiles_cache else None
+                for i in ids]
+
+    def get_posts(
+            self,
+            ids: list,
+            insights: bool,
+            fields: list=None) -> list:
+        """Return posts, in order of `ids` (None if not downloaded).
+
+        Parameters
+        ----------
+        ids : list of strs or ints
+            posts ids
+        insights : bool
+            whether insight fields should be called (requires page access token
+            with admin rights)
+        fields : list of strs or None (default None)
+            called post fields; all POST_FIELDS if None
+        """
+        return self.get_objects(ids, self.post_fields_str(insights, fields))
 
     def add_comments(self, df: pd.DataFrame) -> pd.DataFrame:
         """Return `df` with 'comments_reactions' col.
@@ -683,8 +1500,16 @@ class FbApi(SocialMediaApi):
         df: pd.DataFrame
             Posts dataframe. Must consist of "id" column.
         """
+        if df.empty:
+            return df
+
         posts_ids = list(df.id.unique())
-        comments_df = self.posts_comments(posts_ids)
+        # only likes of comments are needed
+        comments_df = self.posts_comments(posts_ids, fields=["like_count"])
+        if comments_df.empty:
+            df["comments_reactions"] = 0
+            return df
+
         comments_reactions = comments_df.groupby("api_call_id"
                                                  ).like_count.sum()
         df["comments_reactions"] = df.id.map(comments_reactions.to_dict())
@@ -696,7 +1521,8 @@ class FbApi(SocialMediaApi):
             self,
             ids: list,
             n: int=100000,
-            path: str=None
+            path: str=None,
+            fields: list=None
             ) -> pd.DataFrame:
         """Return comments under posts with given ids acquired by api calls.
 
@@ -708,38 +1534,59 @@ class FbApi(SocialMediaApi):
             maximal number of downloaded posts
         path : str
             if passed, dataframe is saved there as csv
+        fields : list of strs or None (default None)
+            if passed, only these comment fields are called (smaller
+            responses), otherwise all COMMENT_FIELDS are called
         """
-        def paginate_elements(first_connection):
-            connection = first_connection
-
-            while len(elements) < n:
-                try:
-                    connection = self.get_next_connection(connection)
-                except KeyError:
+        ids = self.unique_ids(ids)
+
+        def paginate_elements(i, elements, first_connection):
+            # next page is requested only if number of comments is not
+            # exceeded yet
+            if len(elements) >= n:
+                return elements
+            next_connection = self.prefetch_next_connection(first_connection)
+
+            while next_connection is not None:
+                connection = next_connection.result()
+                if connection is None:
                     logging.info(
                         ("connection has no next page: downloading comments "
                          "to post with parameters {}")
                         .format([i, n]))
                     return elements
 
-                if self.returns_data(connection):
-                    elements.extend(self.connection_data(connection))
-                else:
+                if not self.returns_data(connection):
                     logging.error(
                         ("no data in connection {} while downloading comments "
                          "to posts with parameters {}")
                         .format(connection, [i, n]))
                     return elements
 
-        comments = []
-        for i in ids:
-            print(i)
+                page = self.connection_data(connection)
+                next_connection = None
+                if len(elements) + len(page) < n:
+                    # next page is downloaded while this one is processed
+                    next_connection = self.prefetch_next_connection(
+                        connection)
+                elements.extend(page)
+
+            return elements
+
+        def post_comments(i):
+            logging.debug("Downloading comments of post {}".format(i))
             elements = []
-            connection = self.get_post_comments_initial_call(i, n)
-            if self.returns_data(connection):
-                elements.extend(self.connection_data(connection))
-                elements.extend(paginate_elements(connection))
-                comments.extend(self.transform_comments(elements, i))
+            connection = self.get_post_comments_initial_call(
+                i, n, fields=fields)
+            if not self.returns_data(connection):
+                return []
+            elements.extend(self.connection_data(connection))
+            elements = paginate_elements(i, elements, connection)
+            return self.transform_comments(elements, i)
+
+        comments = []
+        for transformed_comments in self.map_concurrently(post_comments, ids):
+            comments.extend(transformed_comments)
 
         df = pd.DataFrame(comments)
         self.save_df(df, path)
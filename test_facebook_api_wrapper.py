@@ -0,0 +1,242 @@
+import datetime
+import json
+
+import pandas as pd
+import pytest
+
+import facebook_api_wrapper
+from facebook_api_wrapper import FbApi
+
+
+def post(i, from_id="page1", created_time="2020-01-01T10:00:00+0000"):
+    return {
+        "id": i,
+        "created_time": created_time,
+        "from": {"id": from_id, "name": "Page"},
+        "comments": {"data": [], "summary": {"total_count": 2}},
+        "reactions": {"data": [], "summary": {"total_count": 5}},
+        "shares": {"count": 1},
+        }
+
+
+class FakeFbApi(FbApi):
+    """FbApi answering batch and comments calls without network."""
+
+    def __init__(self, token="token", **kwargs):
+        super().__init__(token, **kwargs)
+        self.batches = []
+        self.throttled = set()  # ids rate limited on their first request
+        self.failing = set()  # ids answered with a non rate limit error
+        self.timed_out = set()  # ids with null response on their first request
+        self.comments = True
+
+    def get_batch(self, relative_urls):
+        self.batches.append(relative_urls)
+        responses = []
+        for url in relative_urls:
+            i = url.split("?")[0]
+            if i in self.timed_out:
+                self.timed_out.remove(i)
+                responses.append(None)
+            elif i in self.throttled:
+                self.throttled.remove(i)
+                body = {"error": {"code": 4}}
+                responses.append({"code": 403, "body": json.dumps(body)})
+            elif i in self.failing:
+                body = {"error": {"code": 100}}
+                responses.append({"code": 400, "body": json.dumps(body)})
+            elif "fan_count" in url:
+                body = {"id": i, "name": "Page", "fan_count": 10}
+                responses.append({"code": 200, "body": json.dumps(body)})
+            else:
+                responses.append({"code": 200, "body": json.dumps(post(i))})
+        return responses
+
+    def get_profile_posts_initial_call(
+            self, i, since, until, n, insights, fields=None):
+        # two pages of two posts, the last post is before 2020
+        return {
+            "data": [post(i + "_1", i, "2020-03-01T10:00:00+0000"),
+                     post(i + "_2", i, "2020-02-01T10:00:00+0000")],
+            "paging": {"next": i},
+            }
+
+    def get_next_connection(self, connection):
+        i = connection["paging"]["next"]
+        return {"data": [post(i + "_3", i, "2020-01-01T10:00:00+0000"),
+                         post(i + "_4", i, "2019-12-01T10:00:00+0000")]}
+
+    def get_post_comments_initial_call(self, i, n, fields=None):
+        if not self.comments:
+            return {"data": []}
+        return {"data": [{"id": i + "_c", "like_count": 3}]}
+
+
+def test_posts_returns_dataframe():
+    df = FakeFbApi().posts(["1", "2"])
+
+    assert isinstance(df, pd.DataFrame)
+    assert list(df.id) == ["1", "2"]
+    assert list(df.interactions) == [8, 8]
+
+
+def test_posts_with_info_and_comments():
+    df = FakeFbApi().posts(["1"], info=True, comments=True)
+
+    assert df.profile_fan_count.tolist() == [10]
+    assert df.comments_reactions.tolist() == [3]
+
+
+def test_posts_without_comments():
+    api = FakeFbApi()
+    api.comments = False
+
+    df = api.posts(["1", "2"], comments=True)
+
+    assert df.comments_reactions.tolist() == [0, 0]
+
+
+def test_posts_all_failed_with_comments():
+    api = FakeFbApi()
+    api.failing = {"1", "2"}
+
+    df = api.posts(["1", "2"], comments=True)
+
+    assert df.empty
+
+
+def test_posts_saved_to_path(tmp_path):
+    path = str(tmp_path / "posts.csv")
+    FakeFbApi().posts(["1"], path=path)
+
+    assert pd.read_csv(path).id.tolist() == [1]
+
+
+def test_posts_rate_limited_in_batch_are_repeated(monkeypatch):
+    monkeypatch.setattr(facebook_api_wrapper.time, "sleep", lambda s: None)
+    api = FakeFbApi()
+    api.throttled = {"2"}
+
+    df = api.posts(["1", "2"])
+
+    assert list(df.id) == ["1", "2"]
+    assert api.batches[-1] == [
+        "2?fields={}".format(facebook_api_wrapper.POST_FIELDS_STR)]
+
+
+def test_posts_not_completed_in_batch_are_repeated(monkeypatch):
+    monkeypatch.setattr(facebook_api_wrapper.time, "sleep", lambda s: None)
+    api = FakeFbApi()
+    api.timed_out = {"1"}
+
+    df = api.posts(["1", "2"])
+
+    assert list(df.id) == ["1", "2"]
+    assert api.batches[-1] == [
+        "1?fields={}".format(facebook_api_wrapper.POST_FIELDS_STR)]
+
+
+def test_profiles_posts_streamed_as_in_memory(tmp_path):
+    since = datetime.datetime(2020, 1, 1)
+    path = str(tmp_path / "posts.csv")
+    streamed_path = str(tmp_path / "streamed.csv")
+    FakeFbApi().profiles_posts(["a", "b"], since, path=path)
+    streamed = FakeFbApi().profiles_posts(
+        ["a", "b"], since, path=streamed_path, stream=True)
+
+    saved = pd.read_csv(path, index_col=0)
+    # streamed rows of profiles are interleaved, columns of all fields
+    saved_streamed = pd.read_csv(streamed_path, index_col=0)[saved.columns]
+    saved_streamed = saved_streamed.sort_values("id", ignore_index=True)
+    assert streamed.empty
+    assert saved.id.tolist() == [
+        "a_1", "a_2", "a_3", "b_1", "b_2", "b_3"]
+    pd.testing.assert_frame_equal(saved_streamed, saved)
+
+
+def test_profiles_posts_streamed_without_posts(tmp_path):
+    path = str(tmp_path / "posts.csv")
+    api = FakeFbApi()
+    api.get_profile_posts_initial_call = lambda *args, **kwargs: []  # failed
+    api.profiles_posts(
+        ["a"], datetime.datetime(2020, 1, 1), path=path, stream=True)
+
+    saved = pd.read_csv(path, index_col=0)
+    assert saved.empty
+    assert list(saved.columns) == api.posts_columns(False)
+
+
+def test_iter_concurrently_stopped_early():
+    produced = []
+
+    def items(i):
+        for k in range(100):
+            produced.append(k)
+            yield k
+
+    iterator = FakeFbApi().iter_concurrently(items, ["a"])
+    assert next(iterator) == ("a", 0)
+    iterator.close()
+
+    assert len(produced) < 100
+
+
+def test_iter_concurrently_raises_producer_error():
+    def items(i):
+        yield i
+        if i == "b":
+            raise ValueError(i)
+
+    with pytest.raises(ValueError):
+        list(FakeFbApi().iter_concurrently(items, ["a", "b"]))
+
+
+def test_posts_cached(tmp_path):
+    api = FakeFbApi(cache_dir=str(tmp_path))
+    api.posts(["1", "2"])
+    df = api.posts(["1", "2"])
+    api.close()
+
+    assert list(df.id) == ["1", "2"]
+    assert len(api.batches) == 1
+
+
+def test_posts_cache_expired(tmp_path):
+    with FakeFbApi(cache_dir=str(tmp_path), cache_ttl=-1) as api:
+        api.posts(["1"])
+        api.posts(["1"])
+
+    assert len(api.batches) == 2
+
+
+def test_failed_posts_not_cached(tmp_path):
+    api = FakeFbApi(cache_dir=str(tmp_path))
+    api.failing = {"1"}
+    api.posts(["1", "2"])
+    api.failing = set()
+    df = api.posts(["1", "2"])
+    api.close()
+
+    assert list(df.id) == ["1", "2"]
+    assert api.batches[-1] == [
+        "1?fields={}".format(facebook_api_wrapper.POST_FIELDS_STR)]
+
+
+def test_posts_cached_by_token(tmp_path):
+    api = FakeFbApi("token", cache_dir=str(tmp_path))
+    other_api = FakeFbApi("other token", cache_dir=str(tmp_path))
+    api.posts(["1"])
+    other_api.posts(["1"])
+    api.close()
+    other_api.close()
+
+    assert api.cache_prefix != other_api.cache_prefix
+    assert len(other_api.batches) == 1
+
+
+def test_close_shuts_down_prefetch_threads():
+    with FakeFbApi() as api:
+        api.profiles_posts(["a"], datetime.datetime(2020, 1, 1))
+
+    with pytest.raises(RuntimeError):
+        api.prefetch_executor.submit(print)